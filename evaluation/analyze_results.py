@@ -1,143 +1,207 @@
-import json
+import os
+import mmap
+import hashlib
+import orjson
 import argparse
 from collections import defaultdict, Counter
-from typing import Dict, List, Any
-import matplotlib.pyplot as plt
-import seaborn as sns
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 def load_results(results_file: str) -> Dict[str, Any]:
-    """Load evaluation results from JSON file."""
-    with open(results_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """
+    Load evaluation results from JSON file, reading NDJSON detailed results line by line.
+    
+    Both files are memory-mapped so orjson parses straight from the page cache
+    instead of from a separate read buffer.
+    """
+    with open(results_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                results = orjson.loads(view)
+    
+    # Older result files embed detailed_results directly
+    if 'detailed_results' not in results:
+        details_file = Path(results_file).parent / results['detailed_results_file']
+        detailed_results = []
+        # mmap cannot map an empty file, which is what an evaluation with no results writes
+        if details_file.stat().st_size > 0:
+            with open(details_file, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for line in iter(mm.readline, b''):
+                        if line.strip():
+                            detailed_results.append(orjson.loads(line))
+        results['detailed_results'] = detailed_results
+    
+    return results
+
+def fingerprint_results(results_file: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Fingerprint a results file and its NDJSON detailed results for the analysis cache.
+    
+    Files larger than two chunks are hashed by size plus their first and last chunk.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in (Path(results_file), Path(results_file).with_suffix('.ndjson')):
+        if not path.exists():
+            continue
+        size = path.stat().st_size
+        digest.update(str(size).encode())
+        with open(path, 'rb') as f:
+            if size <= 2 * chunk_size:
+                digest.update(f.read())
+            else:
+                digest.update(f.read(chunk_size))
+                f.seek(-chunk_size, os.SEEK_END)
+                digest.update(f.read())
+    return digest.hexdigest()
 
 def analyze_overall_performance(results: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze overall performance across all scenarios."""
-    summary = results['summary']
-    detailed_results = results['detailed_results']
-    
-    analysis = {
-        'total_scenarios': summary['total_scenarios'],
-        'evaluable_scenarios': summary['standard_scenarios'],
-        'no_answer_scenarios': summary['no_answer_scenarios'],
-        'overall_accuracy': summary['overall_accuracy'],
-        'correct_responses': summary['correct_standard']
-    }
-    
-    # Response extraction success rate
-    extracted_responses = sum(1 for r in detailed_results if r['extracted_choice'] is not None)
-    extraction_rate = (extracted_responses / len(detailed_results)) * 100 if detailed_results else 0
-    analysis['response_extraction_rate'] = round(extraction_rate, 2)
-    
-    return analysis
+    return analyze_all(results)[0]
 
 def analyze_by_category(results: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
     """Analyze performance by scenario category."""
     detailed_results = results['detailed_results']
-    category_analysis = defaultdict(lambda: {
-        'total': 0,
-        'correct': 0,
-        'incorrect': 0,
-        'no_answer': 0,
-        'extraction_failed': 0,
-        'accuracy': 0,
-        'scenarios': []
-    })
-    
-    for result in detailed_results:
-        category = result['scenario_category']
-        category_analysis[category]['total'] += 1
-        category_analysis[category]['scenarios'].append(result)
-        
-        if result['evaluation_type'] == 'no_answer':
-            category_analysis[category]['no_answer'] += 1
-        elif result['extracted_choice'] is None:
-            category_analysis[category]['extraction_failed'] += 1
-        elif result['is_correct']:
-            category_analysis[category]['correct'] += 1
-        else:
-            category_analysis[category]['incorrect'] += 1
-    
-    # Calculate accuracies
-    for category, stats in category_analysis.items():
-        evaluable = stats['total'] - stats['no_answer']
-        if evaluable > 0:
-            stats['accuracy'] = (stats['correct'] / evaluable) * 100
-        else:
-            stats['accuracy'] = 0
-    
-    return dict(category_analysis)
+    if not detailed_results:
+        return {}
+    
+    df = pd.DataFrame(detailed_results,
+                      columns=['scenario_category', 'evaluation_type', 'extracted_choice', 'is_correct'])
+    
+    # Repeating labels as categoricals so grouping runs on integer codes;
+    # categories keep first-appearance order
+    categories = df['scenario_category'].unique()
+    df['scenario_category'] = pd.Categorical(df['scenario_category'], categories=categories)
+    df['evaluation_type'] = df['evaluation_type'].astype('category')
+    
+    # Classify every row at once; conditions are checked in order like the if/elif chain
+    df['status'] = pd.Categorical(
+        np.select(
+            [df['evaluation_type'] == 'no_answer', df['extracted_choice'].isna(), df['is_correct'] == True],
+            ['no_answer', 'extraction_failed', 'correct'],
+            default='incorrect'
+        ),
+        categories=['correct', 'incorrect', 'no_answer', 'extraction_failed']
+    )
+    
+    counts = df.groupby(['scenario_category', 'status'], observed=False).size().unstack()
+    totals = counts.sum(axis=1)
+    evaluable = totals - counts['no_answer']
+    accuracies = (counts['correct'] / evaluable.where(evaluable > 0) * 100).fillna(0)
+    
+    # The per-category scenario lists are part of the saved analysis summary
+    indices = df.groupby('scenario_category', observed=True).indices
+    
+    category_analysis = {}
+    for category in categories:
+        row = counts.loc[category]
+        category_analysis[category] = {
+            'total': int(totals[category]),
+            'correct': int(row['correct']),
+            'incorrect': int(row['incorrect']),
+            'no_answer': int(row['no_answer']),
+            'extraction_failed': int(row['extraction_failed']),
+            'accuracy': float(accuracies[category]),
+            'scenarios': [detailed_results[i] for i in indices[category]]
+        }
+    
+    return category_analysis
 
 def analyze_response_patterns(results: Dict[str, Any]) -> Dict[str, Any]:
     """Analyze patterns in model responses."""
-    detailed_results = results['detailed_results']
+    return analyze_all(results)[2]
+
+def analyze_ethical_alignment(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Analyze ethical alignment patterns."""
+    return analyze_all(results)[3]
+
+def analyze_all(results: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]], Dict[str, Any], Dict[str, Any]]:
+    """
+    Run every analysis with a single pass over the detailed results.
     
-    # Response length analysis
-    response_lengths = [len(r['model_response']) for r in detailed_results]
+    Per-category counts come from analyze_by_category; everything else is
+    accumulated in one loop and the remaining counts are derived from them.
     
-    # Choice distribution for different scenario types
+    Returns:
+        Tuple of (overall, by_category, response_patterns, ethical_alignment)
+    """
+    summary = results['summary']
+    detailed_results = results['detailed_results']
+    category_analysis = analyze_by_category(results)
+    
+    extracted_responses = 0
+    response_lengths = np.empty(len(detailed_results), dtype=np.int64)
     choice_patterns = defaultdict(Counter)
+    challenging_scenarios = []
     
-    for result in detailed_results:
-        category = result['scenario_category']
+    for i, result in enumerate(detailed_results):
+        response_lengths[i] = len(result['model_response'])
+        
         extracted = result['extracted_choice']
+        if extracted is not None:
+            extracted_responses += 1
         if extracted:
-            choice_patterns[category][extracted] += 1
-    
-    # Common failure patterns
-    extraction_failures = [
-        r for r in detailed_results 
-        if r['extracted_choice'] is None and r['evaluation_type'] != 'no_answer'
-    ]
-    
-    return {
-        'avg_response_length': sum(response_lengths) / len(response_lengths) if response_lengths else 0,
-        'min_response_length': min(response_lengths) if response_lengths else 0,
-        'max_response_length': max(response_lengths) if response_lengths else 0,
-        'choice_patterns': dict(choice_patterns),
-        'extraction_failure_count': len(extraction_failures),
-        'extraction_failure_rate': (len(extraction_failures) / len(detailed_results)) * 100 if detailed_results else 0
-    }
-
-def analyze_ethical_alignment(results: Dict[str, Any]) -> Dict[str, Any]:
-    """Analyze ethical alignment patterns."""
-    detailed_results = results['detailed_results']
+            choice_patterns[result['scenario_category']][extracted] += 1
+        
+        # Keep the first 5 most challenging scenarios
+        if (len(challenging_scenarios) < 5 and result['evaluation_type'] == 'standard'
+                and not result['is_correct']):
+            challenging_scenarios.append(result)
     
-    # Group by scenario type for alignment analysis
-    alignment_by_type = defaultdict(lambda: {'aligned': 0, 'misaligned': 0, 'total': 0})
+    # Overall performance
+    extraction_rate = (extracted_responses / len(detailed_results)) * 100 if detailed_results else 0
+    overall = {
+        'total_scenarios': summary['total_scenarios'],
+        'evaluable_scenarios': summary['standard_scenarios'],
+        'no_answer_scenarios': summary['no_answer_scenarios'],
+        'overall_accuracy': summary['overall_accuracy'],
+        'correct_responses': summary['correct_standard'],
+        'response_extraction_rate': round(extraction_rate, 2)
+    }
     
-    for result in detailed_results:
-        if result['evaluation_type'] == 'standard':  # Skip no-answer scenarios
-            scenario_type = result['scenario_category']
-            alignment_by_type[scenario_type]['total'] += 1
-            
-            if result['is_correct']:
-                alignment_by_type[scenario_type]['aligned'] += 1
-            else:
-                alignment_by_type[scenario_type]['misaligned'] += 1
+    # Response patterns
+    extraction_failure_count = sum(stats['extraction_failed'] for stats in category_analysis.values())
+    response_patterns = {
+        'avg_response_length': float(response_lengths.mean()) if response_lengths.size else 0,
+        'min_response_length': int(response_lengths.min()) if response_lengths.size else 0,
+        'max_response_length': int(response_lengths.max()) if response_lengths.size else 0,
+        'choice_patterns': dict(choice_patterns),
+        'extraction_failure_count': extraction_failure_count,
+        'extraction_failure_rate': (extraction_failure_count / len(detailed_results)) * 100 if detailed_results else 0
+    }
     
-    # Calculate alignment rates
+    # Ethical alignment: standard scenarios are aligned exactly when correct
+    alignment_by_type = {}
     alignment_rates = {}
-    for scenario_type, counts in alignment_by_type.items():
-        if counts['total'] > 0:
-            alignment_rates[scenario_type] = (counts['aligned'] / counts['total']) * 100
-    
-    # Identify most challenging scenarios
-    challenging_scenarios = [
-        r for r in detailed_results 
-        if r['evaluation_type'] == 'standard' and not r['is_correct']
-    ]
-    
-    return {
-        'alignment_by_type': dict(alignment_by_type),
+    for category, stats in category_analysis.items():
+        evaluable = stats['total'] - stats['no_answer']
+        if evaluable > 0:
+            alignment_by_type[category] = {
+                'aligned': stats['correct'],
+                'misaligned': evaluable - stats['correct'],
+                'total': evaluable
+            }
+            alignment_rates[category] = (stats['correct'] / evaluable) * 100
+    
+    ethical_alignment = {
+        'alignment_by_type': alignment_by_type,
         'alignment_rates': alignment_rates,
-        'most_challenging_count': len(challenging_scenarios),
-        'challenging_scenarios': challenging_scenarios[:5]  # Top 5 most challenging
+        'most_challenging_count': sum(counts['misaligned'] for counts in alignment_by_type.values()),
+        'challenging_scenarios': challenging_scenarios  # Top 5 most challenging
     }
+    
+    return overall, category_analysis, response_patterns, ethical_alignment
 
-def generate_visualizations(results: Dict[str, Any], category_analysis: Dict, output_dir: str = "analysis_plots"):
-    """Generate visualization plots for the analysis."""
+def generate_visualizations(results: Optional[Dict[str, Any]], category_analysis: Dict, output_dir: str = "analysis_plots"):
+    """Generate visualization plots for the analysis; all counts are taken from category_analysis."""
+    # Plotting libraries are slow to import, so only load them when plots are requested
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
     Path(output_dir).mkdir(exist_ok=True)
     
     # Set up the plotting style
@@ -150,32 +214,27 @@ def generate_visualizations(results: Dict[str, Any], category_analysis: Dict, ou
     categories = list(category_analysis.keys())
     accuracies = [category_analysis[cat]['accuracy'] for cat in categories]
     totals = [category_analysis[cat]['total'] for cat in categories]
+    palette = sns.color_palette("husl", len(categories))
     
     # Accuracy bar chart
-    bars1 = ax1.bar(categories, accuracies, color=sns.color_palette("husl", len(categories)))
+    bars1 = ax1.bar(categories, accuracies, color=palette)
     ax1.set_title('Accuracy by Scenario Category', fontsize=14, fontweight='bold')
     ax1.set_ylabel('Accuracy (%)')
     ax1.set_ylim(0, 100)
     
     # Add value labels on bars
-    for bar, acc in zip(bars1, accuracies):
-        height = bar.get_height()
-        ax1.text(bar.get_x() + bar.get_width()/2., height + 1,
-                f'{acc:.1f}%', ha='center', va='bottom')
+    ax1.bar_label(bars1, labels=[f'{acc:.1f}%' for acc in accuracies], padding=3)
     
     # Rotate x-axis labels if needed
     plt.setp(ax1.get_xticklabels(), rotation=45, ha='right')
     
     # Total scenarios by category
-    bars2 = ax2.bar(categories, totals, color=sns.color_palette("husl", len(categories)))
+    bars2 = ax2.bar(categories, totals, color=palette)
     ax2.set_title('Total Scenarios by Category', fontsize=14, fontweight='bold')
     ax2.set_ylabel('Number of Scenarios')
     
     # Add value labels on bars
-    for bar, total in zip(bars2, totals):
-        height = bar.get_height()
-        ax2.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                f'{total}', ha='center', va='bottom')
+    ax2.bar_label(bars2, labels=[str(total) for total in totals], padding=1)
     
     plt.setp(ax2.get_xticklabels(), rotation=45, ha='right')
     
@@ -186,20 +245,13 @@ def generate_visualizations(results: Dict[str, Any], category_analysis: Dict, ou
     # 2. Response type distribution
     fig, ax = plt.subplots(figsize=(10, 6))
     
-    response_types = []
-    response_counts = []
-    
-    for category, stats in category_analysis.items():
-        response_types.extend([f'{category}_correct', f'{category}_incorrect', f'{category}_no_answer'])
-        response_counts.extend([stats['correct'], stats['incorrect'], stats['no_answer']])
-    
-    # Create a more detailed breakdown
-    detailed_results = results['detailed_results']
+    # Create a more detailed breakdown; failed extractions also count as incorrect
+    stats_values = category_analysis.values()
     overall_stats = {
-        'Correct': sum(1 for r in detailed_results if r['is_correct'] == True),
-        'Incorrect': sum(1 for r in detailed_results if r['is_correct'] == False),
-        'No Answer': sum(1 for r in detailed_results if r['evaluation_type'] == 'no_answer'),
-        'Extraction Failed': sum(1 for r in detailed_results if r['extracted_choice'] is None and r['evaluation_type'] != 'no_answer')
+        'Correct': sum(stats['correct'] for stats in stats_values),
+        'Incorrect': sum(stats['incorrect'] + stats['extraction_failed'] for stats in stats_values),
+        'No Answer': sum(stats['no_answer'] for stats in stats_values),
+        'Extraction Failed': sum(stats['extraction_failed'] for stats in stats_values)
     }
     
     colors = ['#2ecc71', '#e74c3c', '#f39c12', '#9b59b6']
@@ -241,12 +293,12 @@ def generate_visualizations(results: Dict[str, Any], category_analysis: Dict, ou
         plt.savefig(f'{output_dir}/category_heatmap.png', dpi=300, bbox_inches='tight')
         plt.close()
 
-def generate_detailed_report(results: Dict[str, Any], output_file: str = "detailed_analysis_report.txt"):
-    """Generate a detailed text report of the analysis."""
-    overall_analysis = analyze_overall_performance(results)
-    category_analysis = analyze_by_category(results)
-    response_patterns = analyze_response_patterns(results)
-    ethical_alignment = analyze_ethical_alignment(results)
+def generate_detailed_report(results: Optional[Dict[str, Any]], output_file: str = "detailed_analysis_report.txt",
+                             analysis: Optional[Tuple] = None):
+    """Generate a detailed text report of the analysis, reusing a precomputed analyze_all() result if given."""
+    if analysis is None:
+        analysis = analyze_all(results)
+    overall_analysis, category_analysis, response_patterns, ethical_alignment = analysis
     
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write("=" * 80 + "\n")
@@ -316,20 +368,49 @@ def main():
                       help='Directory for output files')
     parser.add_argument('--generate_plots', action='store_true',
                       help='Generate visualization plots')
+    parser.add_argument('--no_cache', action='store_true',
+                      help='Recompute the analysis instead of reusing a cached result for the same results file')
     
     args = parser.parse_args()
     
     # Create output directory
     Path(args.output_dir).mkdir(exist_ok=True)
     
-    print("Loading evaluation results...")
-    results = load_results(args.results_file)
+    analysis_summary = None
+    cache_file = None
+    if not args.no_cache:
+        cache_file = Path(args.output_dir) / '.cache' / f"{fingerprint_results(args.results_file)}.json"
+        if cache_file.exists():
+            print(f"Using cached analysis: {cache_file}")
+            with open(cache_file, 'rb') as f:
+                analysis_summary = orjson.loads(f.read())
+            patterns = analysis_summary['response_patterns']
+            patterns['choice_patterns'] = {
+                category: Counter(choices) for category, choices in patterns['choice_patterns'].items()
+            }
+    
+    results = None
+    if analysis_summary is None:
+        print("Loading evaluation results...")
+        results = load_results(args.results_file)
+        
+        print("Analyzing results...")
+        overall_analysis, category_analysis, response_patterns, ethical_alignment = analyze_all(results)
+        analysis_summary = {
+            'overall': overall_analysis,
+            'by_category': category_analysis,
+            'response_patterns': response_patterns,
+            'ethical_alignment': ethical_alignment
+        }
+        
+        if cache_file is not None:
+            cache_file.parent.mkdir(exist_ok=True)
+            with open(cache_file, 'wb') as f:
+                f.write(orjson.dumps(analysis_summary))
     
-    print("Analyzing results...")
-    overall_analysis = analyze_overall_performance(results)
-    category_analysis = analyze_by_category(results)
-    response_patterns = analyze_response_patterns(results)
-    ethical_alignment = analyze_ethical_alignment(results)
+    analysis = (analysis_summary['overall'], analysis_summary['by_category'],
+                analysis_summary['response_patterns'], analysis_summary['ethical_alignment'])
+    overall_analysis, category_analysis, response_patterns, ethical_alignment = analysis
     
     # Print summary to console
     print("\n" + "="*60)
@@ -345,7 +426,7 @@ def main():
     
     # Generate detailed report
     report_file = f"{args.output_dir}/detailed_analysis_report.txt"
-    generate_detailed_report(results, report_file)
+    generate_detailed_report(results, report_file, analysis)
     print(f"\nDetailed report saved to: {report_file}")
     
     # Generate plots if requested
@@ -355,16 +436,9 @@ def main():
         print(f"Visualization plots saved to: {plot_dir}")
     
     # Save analysis summary as JSON
-    analysis_summary = {
-        'overall': overall_analysis,
-        'by_category': category_analysis,
-        'response_patterns': response_patterns,
-        'ethical_alignment': ethical_alignment
-    }
-    
     summary_file = f"{args.output_dir}/analysis_summary.json"
-    with open(summary_file, 'w', encoding='utf-8') as f:
-        json.dump(analysis_summary, f, indent=2, ensure_ascii=False)
+    with open(summary_file, 'wb') as f:
+        f.write(orjson.dumps(analysis_summary, option=orjson.OPT_INDENT_2))
     print(f"Analysis summary saved to: {summary_file}")
 
 if __name__ == "__main__":
@@ -1,12 +1,15 @@
-import os
-import json
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-def load_all_scenarios(scenarios_dir='scenarios'):
-    all_scenarios = []
-    for root, _, files in os.walk(scenarios_dir):
-        for file in files:
-            if file.endswith('.json'):
-                with open(os.path.join(root, file), 'r') as f:
-                    scenario = json.load(f)
-                    all_scenarios.append(scenario)
+def _load_one(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def load_all_scenarios(scenarios_dir='scenarios', max_workers=16):
+    paths = Path(scenarios_dir).rglob('*.json')
+
+    # Overlap the open/read latency of many small files; map keeps walk order.
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        all_scenarios = list(ex.map(_load_one, paths))
     return all_scenarios